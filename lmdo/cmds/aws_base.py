@@ -1,9 +1,86 @@
+import threading
+
 import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError
 
 from lmdo.cli import args
 from lmdo.lmdo_config import lmdo_config
 from lmdo.oprint import Oprint
 
+
+def _get_client_config():
+    """
+    Keep connections alive and pooled so bursts of
+    API calls don't pay for a new TLS handshake each
+    time. Older botocore doesn't support tcp_keepalive
+    or retry mode, fall back to what it understands
+    """
+    kw = {
+        'max_pool_connections': 25,
+        'connect_timeout': 5,
+        'read_timeout': 60,
+    }
+    try:
+        return Config(tcp_keepalive=True, retries={'mode': 'standard', 'max_attempts': 5}, **kw)
+    except (TypeError, BotoCoreError):
+        return Config(retries={'max_attempts': 5}, **kw)
+
+_CLIENT_CONFIG = _get_client_config()
+
+# Sessions shared by all AWSBase instances so credentials
+# are resolved and service models loaded once, keyed by
+# session credentials/region
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Service clients shared by all AWSBase instances.
+# Keyed by service, session credentials/region and endpoint.
+# Also guards creating clients from shared sessions
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# Region and account ID don't change within a process,
+# keyed by session credentials
+_REGIONS = {}
+_ACCOUNT_IDS = {}
+
+
+def _get_session_key(session_kwargs):
+    """Hashable key of session arguments"""
+    return tuple(sorted(session_kwargs.items()))
+
+def _get_cached_session(session_kwargs):
+    """Fetch session from module cache, create one if it doesn't exist yet"""
+    key = _get_session_key(session_kwargs)
+    with _SESSIONS_LOCK:
+        if key not in _SESSIONS:
+            _SESSIONS[key] = boto3.Session(**session_kwargs)
+
+    return _SESSIONS[key]
+
+def _create_client(session, service, **kwargs):
+    """
+    Create client from a shared session. Client creation
+    isn't thread safe but using the created client is
+    """
+    with _CLIENTS_LOCK:
+        return session.client(service, config=_CLIENT_CONFIG, **kwargs)
+
+def _get_cached_client(service, session_kwargs, endpoint_url=None):
+    """
+    Fetch service client from module cache, create one
+    if it doesn't exist yet
+    """
+    key = (service, _get_session_key(session_kwargs), endpoint_url)
+    session = _get_cached_session(session_kwargs)
+    with _CLIENTS_LOCK:
+        if key not in _CLIENTS:
+            _CLIENTS[key] = session.client(service, endpoint_url=endpoint_url, config=_CLIENT_CONFIG)
+
+    return _CLIENTS[key]
+
+
 class AWSBase(object):
     """base AWS delegator class"""
 
@@ -11,6 +88,7 @@ class AWSBase(object):
         self._args = args
         self._config = lmdo_config
         self._profile_name = ''
+        self._name_id = None
 
     @classmethod
     def init_with_parser(cls, config_parser):
@@ -26,9 +104,10 @@ class AWSBase(object):
     @config.setter
     def config(self, config_parser):
         self._config = config_parser
+        self._name_id = None
 
-    def get_session(self):
-        """Fetch AWS session based on AWS CLI credential setup"""
+    def get_session_kwargs(self):
+        """Fetch AWS session arguments based on AWS CLI credential setup"""
         kw = {}
         if self._config.get('AWSKey') and self._config.get('AWSSecret') and self._config.get('Region'):
             kw['aws_access_key_id'] = self._config.get('AWSKey')
@@ -42,30 +121,51 @@ class AWSBase(object):
 
             kw['profile_name'] = self._profile_name
 
-        return boto3.Session(**kw)
+        return kw
+
+    def get_session(self):
+        """Fetch AWS session based on AWS CLI credential setup, shared by instances"""
+        return _get_cached_session(self.get_session_kwargs())
 
     def get_region(self):
         """Get region name from AWS profile"""
-        return self.get_session().region_name
+        key = _get_session_key(self.get_session_kwargs())
+        if key not in _REGIONS:
+            _REGIONS[key] = self.get_session().region_name
+
+        return _REGIONS[key]
 
     def get_account_id(self):
         """Get account ID"""
-        return self.get_session().client('sts').get_caller_identity()['Account']
+        key = _get_session_key(self.get_session_kwargs())
+        if key not in _ACCOUNT_IDS:
+            _ACCOUNT_IDS[key] = self.get_cached_client('sts').get_caller_identity()['Account']
+
+        return _ACCOUNT_IDS[key]
 
     def get_client(self, client_type):
         """Fetch AWS service client"""
-        return self.get_session().client(client_type)
+        return _create_client(self.get_session(), client_type)
+
+    def get_cached_client(self, client_type, endpoint_url=None):
+        """Fetch AWS service client shared across instances"""
+        return _get_cached_client(client_type, self.get_session_kwargs(), endpoint_url)
 
     def get_resource(self, resource_type):
         """Fetch AWS service resource"""
-        return self.get_session().resource(resource_type)
+        with _CLIENTS_LOCK:
+            return self.get_session().resource(resource_type, config=_CLIENT_CONFIG)
 
     def get_name_id(self):
-        return "{}-{}-{}".format(
-            self._config.get('User'),
-            self._config.get('Stage'),
-            self._config.get('Service')
-        ).lower()
+        """Name prefix, built once per config"""
+        if self._name_id is None:
+            self._name_id = "{}-{}-{}".format(
+                self._config.get('User'),
+                self._config.get('Stage'),
+                self._config.get('Service')
+            ).lower()
+
+        return self._name_id
 
     def get_lmdo_format_name(self, name, prefix_disabled=False):
         """Get lmdo name format prefixed with get_name_id"""
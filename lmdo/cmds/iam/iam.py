@@ -14,7 +14,7 @@ class IAM(AWSBase):
 
     def __init__(self):
         super(IAM, self).__init__()
-        self._client = self.get_client('iam') 
+        self._client = self.get_cached_client('iam')
 
     @property
     def client(self):
@@ -1,6 +1,5 @@
-from __future__ import print_function
 import os
-import pip
+import sys
 import tarfile
 import shutil
 import tempfile
@@ -10,25 +9,38 @@ import copy
 import random
 import uuid
 import json
-
+import base64
+import hashlib
+import threading
+import zipfile
+from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from setuptools import find_packages
+from botocore.exceptions import ClientError
 from lambda_packages import lambda_packages
 
 from lmdo.cmds.aws_base import AWSBase
+from lmdo.cmds.lm.lambda_spec import LambdaSpec
 from lmdo.cmds.s3.s3 import S3
+from lmdo.cmds.s3.multipart_upload import BufferedStream
 from lmdo.cmds.s3.bucket_notification import BucketNotification
 from lmdo.cmds.sns.sns import SNS
 from lmdo.cmds.iam.iam import IAM
 from lmdo.cmds.cwe.cloudwatch_event import CloudWatchEvent
 from lmdo.oprint import Oprint
-from lmdo.config import LAMBDA_MEMORY_SIZE, LAMBDA_RUNTIME, LAMBDA_TIMEOUT, LAMBDA_EXCLUDE, PIP_VENDOR_FOLDER, PIP_REQUIREMENTS_FILE
-from lmdo.utils import zipper, get_sitepackage_dirs, class_function_retry, copytree
-from lmdo.spinner import spinner
+from lmdo.config import LAMBDA_EXCLUDE, LAMBDA_MAX_WORKERS, LAMBDA_DIRECT_UPLOAD_SIZE, PIP_VENDOR_FOLDER, PIP_REQUIREMENTS_FILE
+from lmdo.utils import open_zip, zip_files, set_zip_date_time, list_dir_files, hash_file_list, get_sitepackage_dirs, class_function_retry, copytree
 from lmdo.convertors.stack_var_convertor import StackVarConvertor
 
 
 class AWSLambda(AWSBase):
     """Class  create/update lambda function"""
     NAME = 'lambda'
+    # Functions returned by one list_functions page
+    LIST_FUNCTIONS_PAGE_SIZE = 50
     LMDO_HANDLER_DIR = 'lmdo_handlers'
 
     FUNCTION_TYPE_DEFAULT = 'default'
@@ -62,7 +74,7 @@ class AWSLambda(AWSBase):
 
     def __init__(self):
         super(AWSLambda, self).__init__()
-        self._client = self.get_client('lambda') 
+        self._client = self.get_cached_client('lambda')
         self._s3 = S3()
         self._bucket_notification = BucketNotification()
         self._sns = SNS()
@@ -71,6 +83,18 @@ class AWSLambda(AWSBase):
         self._events_dispatcher_arn = {}
         self._heater_arn = None
         self._default_event_role_arn = None
+        # Guard shared heater/role creation between deploy workers
+        self._lock = threading.RLock()
+        self._key_locks = {}
+        self._key_locks_lock = threading.Lock()
+        # Staged packages, uploaded packages and their zip sha256, by content
+        self._packages = {}
+        self._uploaded_packages = {}
+        self._package_sha256s = {}
+        # Function configurations by name, listed once per process()
+        self._function_configurations = None
+        # get_function responses by name, kept during process()/delete()
+        self._functions = None
 
     @property
     def client(self):
@@ -92,23 +116,36 @@ class AWSLambda(AWSBase):
 
     def delete(self):
         """Delete lambda functions"""
+        lambdas = self._config.get('Lambda') or []
+
         # Dont run if doesn't exist
-        if not self._config.get('Lambda'):
+        if not lambdas:
             Oprint.info('No Lambda function configured, skip', 'lambda')
             return True
 
-        # delete  all functions
-        for lm in self._config.get('Lambda'):
-            # Delete event source
-            self.process_event_source(function_config=lm, delete=True)
-            break
+        # Look up each function once while deleting
+        self._functions = {}
+        try:
+            self.delete_functions(lambdas)
+        finally:
+            self._functions = None
+
+        return True
+
+    def delete_functions(self, lambdas):
+        """Delete configured functions and what lmdo created with them"""
+        for lm in lambdas:
+            spec = self.get_lambda_spec(lm)
             # If user specify a function
             specify_function = self.if_specify_function()
-            if specify_function and specify_function != lm.get('FunctionName'):
+            if specify_function and specify_function != spec.name:
                 continue
- 
+
+            # Delete event source
+            self.process_event_source(function_config=lm, delete=True)
+
             # Get function info before being deleted
-            info = self.get_function(self.get_lmdo_format_name(lm.get('FunctionName')))
+            info = self.get_function(spec.full_name)
             if info:
                 # If it's a dispatcher
                 self.delete_rules_for_dispatcher(lm)
@@ -119,10 +156,10 @@ class AWSLambda(AWSBase):
                 self.heat_down(lm)
 
                 # Delete role if it's created by lmdo
-                if not lm.get('RoleArn') or len(lm.get('RoleArn')) <= 0:
+                if not spec.role_arn:
                     self.delete_role(info.get('Configuration').get('Role'))
             else:
-                Oprint.warn('Cannot find function {} to delete in AWS'.format(self.get_lmdo_format_name(lm.get('FunctionName'))), 'lambda')
+                Oprint.warn('Cannot find function {} to delete in AWS'.format(spec.full_name), 'lambda')
             
     def update(self):
         """Wrapper, same action as create"""
@@ -136,23 +173,39 @@ class AWSLambda(AWSBase):
         """get defined function name"""
         return "{}-{}.zip".format(self.get_name_id(), func_name)
 
+    def get_lambda_spec(self, function_config):
+        """Read function config entry, names precomputed"""
+        func_name = function_config.get('FunctionName')
+        return LambdaSpec(
+            function_config,
+            service=self._config.get('Service'),
+            full_name=self.get_lmdo_format_name(func_name),
+            zip_name=self.get_zip_name(func_name),
+            role_name=self.get_role_name(func_name)
+        )
+
     def get_statement_id(self, func_name, principal_id):
         """get defined function permission statement ID"""
         return "stmt-{}-{}".format(self.get_lmdo_format_name(func_name), principal_id)
 
     def add_permission(self, func_name, principal, principal_id, action='lambda:InvokeFunction'):
         """Add permission to Lambda function"""
+        function_name = self.get_lmdo_format_name(func_name)
         try:
             response = self._client.add_permission(
-                FunctionName=self.get_lmdo_format_name(func_name),
+                FunctionName=function_name,
                 StatementId=self.get_statement_id(func_name, principal_id),
                 Action=action,
                 Principal=principal
             )
-            Oprint.info('Permission {} has been added for {} with principal {}'.format(action, self.get_lmdo_format_name(func_name), principal), 'lambda')
-        except Exception as e:
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceConflictException':
+                Oprint.warn('Permission {} for {} with principal {} already exists'.format(action, function_name, principal), 'lambda')
+                return False
+
             Oprint.err(e, 'lambda')
 
+        Oprint.info('Permission {} has been added for {} with principal {}'.format(action, function_name, principal), 'lambda')
         if response.get('Statement') is None:
             Oprint.err('Create lambda permission {} for {}'.format(action, principal), 'lambda')
 
@@ -165,10 +218,14 @@ class AWSLambda(AWSBase):
                 FunctionName=func_name,
                 StatementId=self.get_statement_id(func_name,  principal_id)
             )
-            Oprint.info('Permission has been removed for {}'.format(self.get_lmdo_format_name(func_name)), 'lambda')
-        except Exception as e:
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                Oprint.warn('Permission doesn\'t exist for {}'.format(self.get_lmdo_format_name(func_name)), 'lambda')
+                return False
+
             Oprint.err(e, 'lambda')
 
+        Oprint.info('Permission has been removed for {}'.format(self.get_lmdo_format_name(func_name)), 'lambda')
         return response
     
     @class_function_retry(aws_retry_condition=['InvalidParameterValueException'], tries=10, delay=2)
@@ -189,69 +246,116 @@ class AWSLambda(AWSBase):
         )
         Oprint.info('Lambda function {} has been created'.format(FunctionName), 'lambda')
 
+        if self._function_configurations is not None:
+            self._function_configurations[FunctionName] = response
+        self.forget_function(FunctionName)
+
         return response
 
-    @class_function_retry(aws_retry_condition=['InvalidParameterValueException'], tries=10, delay=2)
+    @class_function_retry(aws_retry_condition=['InvalidParameterValueException', 'ResourceConflictException'], tries=10, delay=2)
     def update_function_configuration(self, **kargs):
         """
         Wrapper for AWS lambda client as policy change
         can take longer than updating function configuration
         """
         response = self._client.update_function_configuration(**kargs)
+        self.forget_function(kargs.get('FunctionName'))
 
     def delete_function(self, func_name, **kwargs):
         """Wrapper to delete lambda function"""
+        Oprint.info('Start deleting Lambda function {}'.format(func_name), 'lambda')
         try:
-            Oprint.info('Start deleting Lambda function {}'.format(func_name), 'lambda')
             response = self._client.delete_function(FunctionName=func_name, **kwargs)
-            Oprint.info('Lambda function {} has been deleted'.format(func_name), 'lambda')
-        except Exception as e:
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                Oprint.warn('Lambda function {} doesn\'t exist'.format(func_name), 'lambda')
+                return False
+
             Oprint.err(e, 'lambda')
 
+        self.forget_function(func_name)
+        Oprint.info('Lambda function {} has been deleted'.format(func_name), 'lambda')
         return response
 
     def invoke(self, func_name, **kwargs):
         """Wrapper for invoke"""
         try:
-            response = self._client.invoke(
+            return self._client.invoke(
                 FunctionName=self.get_lmdo_format_name(func_name),
                 **kwargs
             )
-        except Exception as e:
+        except ClientError as e:
             Oprint.err(e, 'lambda')
 
-        return response
-
     def list_functions(self, **kwargs):
         """Wrapper for listing functions"""
         try:
-            response = self._client.list_functions(**kwargs)
-        except Exception as e:
+            return self._client.list_functions(**kwargs)
+        except ClientError as e:
             Oprint.err(e, 'lambda')
 
-        return response
-
-    def update_function_code(self, func_name, bucket_name, s3_key):
-        """Update lambda code"""
+    def update_function_code(self, func_name, **kwargs):
+        """Update lambda code, from S3 object or zip file content"""
         try:
-            response = self._client.update_function_code(
-                FunctionName=func_name,
-                S3Bucket=bucket_name,
-                S3Key=s3_key
-            )
-            Oprint.info('Lambda function {} codes has been updated'.format(func_name), 'lambda')
-        except Exception as e:
+            response = self._client.update_function_code(FunctionName=func_name, **kwargs)
+        except ClientError as e:
+            # Caller can deploy zip file content through S3 instead
+            if e.response['Error']['Code'] == 'RequestEntityTooLargeException' and 'ZipFile' in kwargs:
+                raise
+
             Oprint.err(e, 'lambda')
-                
+
+        self.forget_function(func_name)
+        Oprint.info('Lambda function {} codes has been updated'.format(func_name), 'lambda')
         return response
 
     def get_function(self, func_name, **kwargs):
-        """Get function info"""
+        """
+        Get function info, False if it doesn't exist. Cached
+        while process() or delete() is running
+        """
+        cache = self._functions is not None and not kwargs
+        if cache and func_name in self._functions:
+            return self._functions[func_name]
+
         try:
-            return self._client.get_function(FunctionName=func_name, **kwargs)
-        except Exception as e:
-            pass
-            #Oprint.err(e, 'lambda')
+            info = self._client.get_function(FunctionName=func_name, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                Oprint.err(e, 'lambda')
+
+            info = False
+
+        if cache:
+            self._functions[func_name] = info
+
+        return info
+
+    def forget_function(self, func_name):
+        """Drop cached info of a function that has changed"""
+        if self._functions is not None:
+            self._functions.pop(func_name, None)
+
+    def load_function_configurations(self):
+        """List all functions configuration, paginated"""
+        configurations = {}
+        paginator = self._client.get_paginator('list_functions')
+        for page in paginator.paginate():
+            for configuration in page['Functions']:
+                configurations[configuration['FunctionName']] = configuration
+
+        self._function_configurations = configurations
+
+        return configurations
+
+    def get_function_configuration(self, func_name):
+        """Get function configuration from listing if loaded"""
+        if self._function_configurations is not None:
+            return self._function_configurations.get(func_name, False)
+
+        info = self.get_function(func_name)
+        if info:
+            return info.get('Configuration')
 
         return False
     
@@ -261,57 +365,128 @@ class AWSLambda(AWSBase):
         if not os.path.isfile(init_file):
             open(init_file, 'a').close()
 
-    def get_zipped_package(self, function_config):
-        """Packaging lambda"""
-        func_name = function_config.get('FunctionName')
-        func_type = function_config.get('Type')
+    def get_zipped_package(self, spec, fileobj=None):
+        """
+        Packaging lambda into fileobj if given,
+        otherwise into a zip file in temp dir
+        """
+        package = self.get_package(spec)
+        if not package:
+            return False, False
+
+        target_temp_dir = None
+        target = fileobj
+        if target is None:
+            # Create zip file temp dir
+            target_temp_dir = tempfile.mkdtemp()
+            target = '{}/{}'.format(target_temp_dir, spec.zip_name)
+
+        _, package_files, _ = package
+        zip_file = open_zip(target)
+        zip_files(zip_file, package_files)
+        zip_file.close()
+
+        return (target_temp_dir, target)
+
+    def get_package_key(self, spec):
+        """Functions with the same key have identical package content"""
+        if spec.function_type == self.FUNCTION_TYPE_GO:
+            return (spec.function_type, spec.executable_name)
 
-        # Create packaging temp dir
-        lambda_temp_dir = tempfile.mkdtemp()
-        # Create zip file temp dir
-        target_temp_dir = tempfile.mkdtemp()
-        target = '{}/{}'.format(target_temp_dir, self.get_zip_name(func_name))
+        return (spec.function_type,)
+
+    def get_key_lock(self, key):
+        """Fetch lock dedicated to key"""
+        with self._key_locks_lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+
+        return self._key_locks[key]
+
+    def get_package(self, spec):
+        """
+        Return (staging dir, file list, digest) of the function
+        package. Staged once for all functions sharing content
+        """
+        key = self.get_package_key(spec)
+        with self.get_key_lock(('package',) + key):
+            if key not in self._packages:
+                self._packages[key] = self.stage_package(spec)
+
+        return self._packages[key]
+
+    def clean_packages(self):
+        """Remove staged packages"""
+        for package in self._packages.values():
+            if package:
+                shutil.rmtree(package[0], ignore_errors=True)
+
+        self._packages = {}
+        self._uploaded_packages = {}
+        self._package_sha256s = {}
+
+    def stage_package(self, spec):
+        """Copy package content to temp dir and list files to zip"""
+        func_name = spec.name
+        func_type = spec.function_type
+
+        # Create packaging temp dir, project files and dependencies
+        # are staged separately so they can be prepared concurrently
+        staging_dir = tempfile.mkdtemp()
+        lambda_temp_dir = os.path.join(staging_dir, 'function')
+        deps_temp_dir = os.path.join(staging_dir, 'deps')
+        wsgi_temp_dir = os.path.join(staging_dir, 'wsgi')
+        for temp_dir in [lambda_temp_dir, deps_temp_dir, wsgi_temp_dir]:
+            os.mkdir(temp_dir)
+
+        # Functions are packaged concurrently, don't share excludes
+        lambda_exclude = copy.deepcopy(LAMBDA_EXCLUDE)
+        package_files = []
+        pip_processes = []
 
         self.add_init_file_to_root(lambda_temp_dir)
  
         if func_type == self.FUNCTION_TYPE_WSGI:
-            self.pip_wsgi_install(lambda_temp_dir)
+            pip_processes.append(self.pip_wsgi_install(wsgi_temp_dir))
       
         # Heater is one file only from lmdo. don't need packages
         if func_type != self.FUNCTION_TYPE_HEATER:
             # Go only need executables
             if func_type == self.FUNCTION_TYPE_GO:
-                if not function_config.get('ExecutableName'):
+                if not spec.executable_name:
                     Oprint.err('ExecutableName is not defined in lmdo config, function {} won\'t be deployed'.format(func_name), self.NAME)
-                    return False, False
+                    return False
                 
                 # We only have on executable needed 
-                shutil.copy(os.path.join(os.getcwd(), function_config.get('ExecutableName')), lambda_temp_dir)
+                shutil.copy(os.path.join(os.getcwd(), spec.executable_name), lambda_temp_dir)
+                pip_processes += self.dependency_packaging(deps_temp_dir, lambda_temp_dir)
             else: 
-                # Copy project files
+                # Installing package while copying project files
+                pip_processes += self.dependency_packaging(deps_temp_dir, os.getcwd())
                 copytree(os.getcwd(), lambda_temp_dir, ignore=shutil.ignore_patterns('*.git*'))
 
-            # Installing package
-            self.dependency_packaging(lambda_temp_dir)
-            
-            replace_path = [
-                {
-                   'from_path': lambda_temp_dir,
-                   'to_path': '.'
-                }
-            ]
+            # Zip needs all dependencies in place
+            self.wait_pip_install(pip_processes)
 
-            # Zip what we've got so far
-            zipper(lambda_temp_dir, target, LAMBDA_EXCLUDE, False, replace_path)
+            # Project files take precedence over wsgi
+            # packages, which take precedence over dependencies
+            for temp_dir in [deps_temp_dir, wsgi_temp_dir, lambda_temp_dir]:
+                replace_path = [
+                    {
+                       'from_path': temp_dir,
+                       'to_path': '.'
+                    }
+                ]
+
+                package_files += list_dir_files(temp_dir, lambda_exclude, replace_path)
 
-       
         # Default type function doesn't need lmdo's lambda wrappers
         if func_type != self.FUNCTION_TYPE_DEFAULT:
             # Don't load lmdo __init__.py
-            if LAMBDA_EXCLUDE.get('LAMBDA_EXCLUDE'):
-                LAMBDA_EXCLUDE['file_with_path'].append('*{}/{}/__init__.py'.format(self.LMDO_HANDLER_DIR, func_type))
+            if lambda_exclude.get('file_with_path'):
+                lambda_exclude['file_with_path'].append('*{}/{}/__init__.py'.format(self.LMDO_HANDLER_DIR, func_type))
             else:
-                LAMBDA_EXCLUDE['file_with_path'] = ['*{}/{}/__init__.py'.format(self.LMDO_HANDLER_DIR, func_type)]
+                lambda_exclude['file_with_path'] = ['*{}/{}/__init__.py'.format(self.LMDO_HANDLER_DIR, func_type)]
 
             replace_path = [
                 {
@@ -320,11 +495,117 @@ class AWSLambda(AWSBase):
                 }
             ]
             
-            # Zip extra lmdo function handler
-            zipper(self.get_lmdo_function_dir(func_type), target, LAMBDA_EXCLUDE, False, replace_path)
+            # Extra lmdo function handler
+            package_files += list_dir_files(self.get_lmdo_function_dir(func_type), lambda_exclude, replace_path)
 
-        shutil.rmtree(lambda_temp_dir)
-        return (target_temp_dir, target)
+        # Later files override earlier ones with the same name
+        package_files = list(OrderedDict((package_file[1], package_file) for package_file in package_files).values())
+
+        # Staged copies are ours, fix their timestamp so they're streamed into zip
+        package_files = [set_zip_date_time(package_file) if package_file[0].startswith(staging_dir + os.sep) else package_file for package_file in package_files]
+
+        return (staging_dir, package_files, hash_file_list(package_files))
+
+    def upload_package(self, spec, direct=True):
+        """
+        Get function package ready for deployment, return the Code
+        parameter and if function code needs updating. Small packages
+        are sent to Lambda directly unless direct is False, bigger ones
+        go through S3. S3
+        upload is skipped when the bucket holds the package already,
+        code update when the function runs it already. Functions with
+        identical content reuse the package of the first one
+        """
+        package = self.get_package(spec)
+        if not package:
+            return False, False
+
+        _, _, digest = package
+        bucket_name = spec.s3_bucket
+        s3_key = spec.zip_name
+        s3_code = {'S3Bucket': bucket_name, 'S3Key': s3_key}
+
+        metadata = self._s3.get_object_metadata(bucket_name, s3_key)
+        if metadata.get('sha256') == digest:
+            Oprint.info('Package {} is in S3 already, skip uploading'.format(s3_key), 's3')
+            code = s3_code
+            code_sha256 = self.get_package_sha256(spec)
+        else:
+            upload_key = (bucket_name, digest)
+            with self.get_key_lock(('upload',) + upload_key):
+                if upload_key not in self._uploaded_packages or (not direct and 'ZipFile' in self._uploaded_packages[upload_key][0]):
+                    self._uploaded_packages[upload_key] = self.stream_package(spec, digest, direct)
+                elif 'S3Key' in self._uploaded_packages[upload_key][0]:
+                    Oprint.info('Function {} has identical package, copy from {}'.format(spec.name, self._uploaded_packages[upload_key][0]['S3Key']), 's3')
+                    self._s3.copy_object(bucket_name, self._uploaded_packages[upload_key][0]['S3Key'], s3_key)
+
+            code, code_sha256 = self._uploaded_packages[upload_key]
+            if 'ZipFile' in code and metadata:
+                # Don't leave an outdated package behind
+                self._s3.delete_object(bucket_name, s3_key)
+            elif 'S3Key' in code:
+                code = s3_code
+
+        # Only the function knows which code it runs
+        configuration = self.get_function_configuration(spec.full_name)
+        if configuration and configuration.get('CodeSha256') == code_sha256:
+            Oprint.info('Function {} runs package {} already'.format(spec.full_name, s3_key), 'lambda')
+            return code, False
+
+        return code, True
+
+    def stream_package(self, spec, digest, direct=True):
+        """
+        Zip package into S3 as it's written, return Code parameter
+        and its sha256. If direct, packages that stay small enough
+        are kept in memory and given to Lambda as zip file content
+        """
+        _, package_files, _ = self.get_package(spec)
+        bucket_name = spec.s3_bucket
+        s3_key = spec.zip_name
+
+        # Zip can't be bigger than its content, hold back only those
+        # that may fit, others start uploading after the first part
+        threshold = None
+        if direct and sum(package_file[3] for package_file in package_files) <= LAMBDA_DIRECT_UPLOAD_SIZE:
+            threshold = LAMBDA_DIRECT_UPLOAD_SIZE
+
+        with self._s3.open_upload(bucket_name, s3_key, threshold=threshold, Metadata={'sha256': digest}) as upload:
+            self.get_zipped_package(spec, upload)
+
+            if direct and not upload.started:
+                # Never reached S3, keep it for Lambda
+                zip_content = upload.getvalue()
+                upload.abort()
+
+        if not direct or upload.started:
+            Oprint.info('Complete uploading {}. (size:{}B)'.format(s3_key, upload.size), 's3')
+            code = {'S3Bucket': bucket_name, 'S3Key': s3_key}
+            code_sha256 = base64.b64encode(upload.digest()).decode('ascii')
+        else:
+            Oprint.info('Package {} is small enough to deploy without S3. (size:{}B)'.format(s3_key, len(zip_content)), 'lambda')
+            code = {'ZipFile': zip_content}
+            code_sha256 = base64.b64encode(hashlib.sha256(zip_content).digest()).decode('ascii')
+
+        self._package_sha256s[digest] = code_sha256
+
+        return code, code_sha256
+
+    def get_package_sha256(self, spec):
+        """
+        sha256 of the zipped package as Lambda reports it in
+        CodeSha256. Zips are reproducible, so one not uploaded
+        in this run is zipped again only to be hashed
+        """
+        _, _, digest = self.get_package(spec)
+        with self.get_key_lock(('sha256', digest)):
+            if digest not in self._package_sha256s:
+                stream = BufferedStream(part_size=1)
+                self.get_zipped_package(spec, stream)
+                stream.close()
+                self._package_sha256s[digest] = base64.b64encode(stream.digest()).decode('ascii')
+
+        return self._package_sha256s[digest]
 
     def get_lmdo_function_dir(self, func_type):
         """Get different function directory"""
@@ -363,9 +644,50 @@ class AWSLambda(AWSBase):
             Oprint.info('No Lambda function configured, skip...', 'lambda')
             return True
 
-        # Create all functions
+        # Create all functions, each one is mostly network bound
+        # so deploy them concurrently
+        max_workers = max(1, min(int(os.getenv('LAMBDA_MAX_WORKERS', LAMBDA_MAX_WORKERS)), len(config_data)))
+        self._functions = {}
+        try:
+            if not self._args.get('package'):
+                # Ask about missing buckets before workers start
+                self.confirm_buckets(config_data)
+                # One listing instead of checking every function, unless
+                # looking them up one by one takes fewer calls
+                if not self.if_specify_function() and len(config_data) >= self.LIST_FUNCTIONS_PAGE_SIZE:
+                    self.load_function_configurations()
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(self.function_update_or_create, function_config, package_only) for function_config in config_data]
+                try:
+                    # Errors in workers are raised here
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # Don't deploy the rest once one has failed
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            self._function_configurations = None
+            self._functions = None
+            self.clean_packages()
+
+        return True
+
+    def confirm_buckets(self, config_data):
+        """Make sure buckets of functions to deploy exist, each checked once"""
+        specify_function = self.if_specify_function()
+        bucket_names = []
         for lm in config_data:
-            self.function_update_or_create(lm, package_only)
+            if specify_function and specify_function != lm.get('FunctionName'):
+                continue
+
+            if lm.get('S3Bucket') and lm.get('S3Bucket') not in bucket_names:
+                bucket_names.append(lm.get('S3Bucket'))
+
+        for bucket_name in bucket_names:
+            self._s3.confirm_bucket(bucket_name)
 
         return True
 
@@ -377,64 +699,28 @@ class AWSLambda(AWSBase):
             return True
  
         function_config = self.update_function_config(function_config)
-        
-        params = {
-            'FunctionName': self.get_lmdo_format_name(function_config.get('FunctionName')),
-            'Code': {
-                'S3Bucket': function_config.get('S3Bucket'),
-                'S3Key': self.get_zip_name(function_config.get('FunctionName'))
-            },
-            'Handler': function_config.get('Handler'),
-            'MemorySize': function_config.get('MemorySize') or LAMBDA_MEMORY_SIZE,
-            'Runtime': function_config.get('Runtime') or LAMBDA_RUNTIME,
-            'Timeout': function_config.get('Timeout') or LAMBDA_TIMEOUT,
-            'Description': function_config.get('Description') or 'Function deployed for service {} by lmdo'.format(self._config.get('Service'))
-        }
-
-        # If we have tracing flag active 
-        params['TracingConfig'] = {'Mode': 'PassThrough'}
-        if function_config.get("Tracing"):
-            params['TracingConfig'] = {'Mode': 'Active'}
-
-        if function_config.get('VpcConfig'):                
-            params['VpcConfig'] = function_config.get('VpcConfig')
-
-        if function_config.get('EnvironmentVariables'):
-            ev = function_config.get('EnvironmentVariables')
-            # Convert all value to string
-            nev = {}
-            for k, v in ev.iteritems():
-                nev[k] = str(v)
+        spec = self.get_lambda_spec(function_config)
 
-            params['Environment'] = {'Variables': nev}
-
-        tmp_path, zip_package = self.get_zipped_package(function_config)
-        
-        if zip_package:
-            # Only package up lambda function
-            if self._args.get('package'):
+        # Only package up lambda function
+        if self._args.get('package'):
+            _, zip_package = self.get_zipped_package(spec)
+            if zip_package:
                 Oprint.info('Generated zipped lambda package {}'.format(zip_package), 'lambda')
                 return True
+        else:
+            code, changed = self.upload_package(spec)
+            if code:
+                try:
+                    self.deploy_function(spec, code, changed)
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'RequestEntityTooLargeException' or 'ZipFile' not in code:
+                        Oprint.err(e, 'lambda')
+
+                    # Too big once encoded in the request, go through S3
+                    Oprint.warn('Package {} is too big to deploy without S3, uploading it'.format(spec.zip_name), 'lambda')
+                    code, _ = self.upload_package(spec, direct=False)
+                    self.deploy_function(spec, code, True)
 
-            if self._s3.upload_file(function_config.get('S3Bucket'), zip_package, self.get_zip_name(function_config.get('FunctionName'))):
-                # If function exists
-                info = self.get_function(self.get_lmdo_format_name(function_config.get('FunctionName')))
-                if info:
-                    role_arn = function_config.get('RoleArn') or self.create_role(self.get_role_name(function_config.get('FunctionName')), function_config.get('RolePolicy'))
-                    self.update_function_code(info.get('Configuration').get('FunctionName'), function_config.get('S3Bucket'), self.get_zip_name(function_config.get('FunctionName')))
-                   
-                    params.pop('Code')
-                    self.update_function_configuration(**params)
-                    Oprint.info('Updated lambda function configuration', 'lambda')
-                else:
-                    # User configured role or create a new on based on policy document
-                    role_arn = function_config.get('RoleArn') or self.create_role(self.get_role_name(function_config.get('FunctionName')), function_config.get('RolePolicy'))
-                    params['Role'] = role_arn
-                    self.create_function(**params)
-
-            # Clean up
-            shutil.rmtree(tmp_path)
-        
         # Add container heater
         self.heat_up(function_config)
         # If it's a dispatcher
@@ -443,6 +729,42 @@ class AWSLambda(AWSBase):
         # If it has event source configuration
         self.process_event_source(function_config)
 
+    def deploy_function(self, spec, code, changed):
+        """
+        Create function or update its code and configuration.
+        RequestEntityTooLargeException for zip file content is
+        raised so the caller can deploy through S3 instead
+        """
+        params = spec.get_function_params(code)
+        # User configured role or create a new on based on policy document
+        role_arn = spec.role_arn or self.create_role(spec.role_name, spec.role_policy)
+
+        # If function exists
+        configuration = self.get_function_configuration(spec.full_name)
+        if not configuration:
+            try:
+                self.create_function(Role=role_arn, **params)
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'RequestEntityTooLargeException' and 'ZipFile' in code:
+                    raise
+
+                if e.response['Error']['Code'] != 'ResourceConflictException':
+                    Oprint.err(e, 'lambda')
+
+                # Created since we checked, update it instead
+                configuration = {'FunctionName': spec.full_name}
+                changed = True
+
+        if configuration:
+            if changed:
+                self.update_function_code(configuration.get('FunctionName'), **code)
+
+            params.pop('Code')
+            self.update_function_configuration(**params)
+            Oprint.info('Updated lambda function configuration', 'lambda')
+
+        return True
+
     def update_function_config(self, function_config):
         """Update function config value based on types"""
         # Set default if not set
@@ -475,17 +797,39 @@ class AWSLambda(AWSBase):
         """Delete role for lambda"""
         self._iam.delete_lambda_role(self.get_role_name_by_arn(role_arn))
 
-    def dependency_packaging(self, tmp_path):
-        """Packaging dependencies"""
+    def dependency_packaging(self, tmp_path, source_path):
+        """
+        Packaging dependencies into tmp_path, return pip install
+        processes still running
+        """
         if self._config.get('VirtualEnv'):
             self.venv_package_install(tmp_path)
-        else:
-            self.package_install(tmp_path)
+            return []
+
+        process = self.package_install(tmp_path, source_path)
+        return [process] if process else []
+
+    def pip_install(self, tmp_path, *args):
+        """Start pip install into tmp_path in a subprocess"""
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.Popen([sys.executable, '-m', 'pip', 'install', '-q', '-t', tmp_path] + list(args), stdout=devnull, stderr=devnull)
 
-    def package_install(self, tmp_path):
-        """Install requirement"""
-        if os.path.isfile('{}/{}'.format(tmp_path, os.getenv('PIP_REQUIREMENTS_FILE', PIP_REQUIREMENTS_FILE))):
-            with open('{}/{}'.format(tmp_path, os.getenv('PIP_REQUIREMENTS_FILE', PIP_REQUIREMENTS_FILE))) as f:
+    def wait_pip_install(self, processes):
+        """
+        Wait for pip install processes to complete. No spinner,
+        packages are staged by concurrent deploy workers
+        """
+        for process in processes:
+            if process.wait() != 0:
+                Oprint.warn('pip install exited with code {}'.format(process.returncode), 'pip')
+
+        return True
+
+    def package_install(self, tmp_path, source_path):
+        """Start installing requirement found in source_path"""
+        requirements_file = '{}/{}'.format(source_path, os.getenv('PIP_REQUIREMENTS_FILE', PIP_REQUIREMENTS_FILE))
+        if os.path.isfile(requirements_file):
+            with open(requirements_file) as f:
                 requirements = [item.strip().lower() for item in f.read().splitlines() if item.strip()]
             try:
                 lambda_pkg_to_install = {}
@@ -519,38 +863,28 @@ class AWSLambda(AWSBase):
                         #tar.extract(member, os.getenv('PIP_VENDOR_FOLDER', PIP_VENDOR_FOLDER))
                         tar.extract(member, tmp_path)
            
-                tmp_requirements = tempfile.NamedTemporaryFile(delete=False)
-                for line in requirements:                     
-                    tmp_requirements.write(line + '\n')
-                tmp_requirements.close()
+                # pip reads it in background, keep it in the staging
+                # dir so it's removed along with the package
+                with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', dir=os.path.dirname(tmp_path), delete=False) as tmp_requirements:
+                    for line in requirements:
+                        tmp_requirements.write(line + '\n')
 
                 Oprint.info('Installing python package dependancies to {}'.format(tmp_path), 'pip')
-                spinner.start()
-                os.system('pip install -t {} -r {} &>/dev/null'.format(tmp_path, tmp_requirements.name))
-                spinner.stop()
+                return self.pip_install(tmp_path, '-r', tmp_requirements.name)
             except Exception as e:
-                spinner.stop()
                 Oprint.err(e, 'pip')
         else:
             Oprint.warn('{} could not be found, no dependencies will be installed'.format(os.getenv('PIP_REQUIREMENTS_FILE', PIP_REQUIREMENTS_FILE)), 'pip')
 
-    def pip_wsgi_install(self, tmp_path):
-        """Install requirement for wsgi"""
-        try:
-            Oprint.info('Installing python package dependancies for wsgi', 'pip')
-
-            spinner.start()
-            os.system('pip install werkzeug base58 wsgi-request-logger -t {} &>/dev/null'.format(tmp_path))
-            spinner.stop()
+        return None
 
-            #Oprint.info('Wsgi python package installation complete', 'pip')
-        except Exception as e:
-            spinner.stop()
-            raise e
+    def pip_wsgi_install(self, tmp_path):
+        """Start installing requirement for wsgi"""
+        Oprint.info('Installing python package dependancies for wsgi', 'pip')
+        return self.pip_install(tmp_path, 'werkzeug', 'base58', 'wsgi-request-logger')
     
     def venv_package_install(self, tmp_path):
         """Install virtualenv packages"""
-        import pip
         venv = self.get_current_venv_path()
         
         cwd = os.getcwd()
@@ -615,7 +949,6 @@ class AWSLambda(AWSBase):
         # Related: https://github.com/Miserlou/Zappa/issues/398
         try:
             Oprint.info('Installing virtualenv python package dependancies to {}'.format(tmp_path), 'pip')
-            spinner.start()
             for installed_package_name in installed_packages_name_set:
                 wheel_url = self.get_manylinux_wheel(installed_package_name)
                 if wheel_url:
@@ -624,9 +957,7 @@ class AWSLambda(AWSBase):
                     zipresp = resp.raw
                     with zipfile.ZipFile(BytesIO(zipresp.read())) as zfile:
                         zfile.extractall(tmp_path)
-            spinner.stop()
         except Exception as e:
-            spinner.stop()
             Oprint.warn(e, 'pip')
     
     def get_virtualenv_installed_package(self):
@@ -696,11 +1027,11 @@ class AWSLambda(AWSBase):
         # Return cache
         if not self._events_dispatcher_arn.get(function_name):
             # Return arn if exist otherwise create a new one
-            info = self.get_function(self.get_lmdo_format_name(function_name))
-            if not info or not info.get('Configuration').get('FunctionArn'):
+            configuration = self.get_function_configuration(self.get_lmdo_format_name(function_name))
+            if not configuration or not configuration.get('FunctionArn'):
                 Oprint.err('You have not config lmdo event dispatch lambda function', self.NAME)
                 
-            self._events_dispatcher_arn[function_name] = info.get('Configuration').get('FunctionArn')
+            self._events_dispatcher_arn[function_name] = configuration.get('FunctionArn')
             
         return self._events_dispatcher_arn.get(function_name)
 
@@ -748,8 +1079,9 @@ class AWSLambda(AWSBase):
 
     def get_default_event_role_arn(self):
         """Get default event role"""
-        if not self._default_event_role_arn:
-            self._default_event_role_arn = self._iam.create_default_events_role(role_name=self.get_lmdo_format_name('default-events-lambda'))['Role']['Arn']
+        with self._lock:
+            if not self._default_event_role_arn:
+                self._default_event_role_arn = self._iam.create_default_events_role(role_name=self.get_lmdo_format_name('default-events-lambda'))['Role']['Arn']
 
         return self._default_event_role_arn
 
@@ -872,15 +1204,17 @@ class AWSLambda(AWSBase):
             'Description': 'Lmdo heating function deployed for service {} by lmdo'.format(self._config.get('Service'))
         }
 
-        if not self._heater_arn:
-            info = self.get_function(self.get_lmdo_format_name(self.NAME_HEATER))
-            if not info:
-                self.function_update_or_create(function_config=function_config, ignore_cmd=True)
-            
-            info = self.get_function(self.get_lmdo_format_name(self.NAME_HEATER))
-            self._heater_arn = info.get('Configuration').get('FunctionArn')
-            self.delete_event_permission_to_lambda(self._heater_arn, self.NAME_HEATER)
-            self.add_event_permission_to_lambda(self._heater_arn, self.NAME_HEATER)
+        # Only one heater is shared by all functions
+        with self._lock:
+            if not self._heater_arn:
+                configuration = self.get_function_configuration(self.get_lmdo_format_name(self.NAME_HEATER))
+                if not configuration:
+                    self.function_update_or_create(function_config=function_config, ignore_cmd=True)
+
+                configuration = self.get_function_configuration(self.get_lmdo_format_name(self.NAME_HEATER))
+                self._heater_arn = configuration.get('FunctionArn')
+                self.delete_event_permission_to_lambda(self._heater_arn, self.NAME_HEATER)
+                self.add_event_permission_to_lambda(self._heater_arn, self.NAME_HEATER)
 
         return self._heater_arn
 
@@ -0,0 +1,65 @@
+from lmdo.config import LAMBDA_MEMORY_SIZE, LAMBDA_RUNTIME, LAMBDA_TIMEOUT
+
+
+class LambdaSpec(object):
+    """
+    Function settings read once from its lmdo config
+    entry, defaults applied. Names derived from the
+    function name are precomputed by the caller
+    """
+    __slots__ = (
+        'config', 'name', 'full_name', 'zip_name', 'role_name',
+        'function_type', 's3_bucket', 'handler', 'executable_name',
+        'role_arn', 'role_policy', 'memory_size', 'runtime', 'timeout',
+        'description', 'tracing', 'vpc_config', 'environment_variables',
+    )
+
+    def __init__(self, function_config, service=None, full_name=None, zip_name=None, role_name=None):
+        self.config = function_config
+        self.name = function_config.get('FunctionName')
+        self.full_name = full_name
+        self.zip_name = zip_name
+        self.role_name = role_name
+        self.function_type = function_config.get('Type')
+        self.s3_bucket = function_config.get('S3Bucket')
+        self.handler = function_config.get('Handler')
+        self.executable_name = function_config.get('ExecutableName')
+        self.role_arn = function_config.get('RoleArn')
+        self.role_policy = function_config.get('RolePolicy')
+        self.memory_size = function_config.get('MemorySize') or LAMBDA_MEMORY_SIZE
+        self.runtime = function_config.get('Runtime') or LAMBDA_RUNTIME
+        self.timeout = function_config.get('Timeout') or LAMBDA_TIMEOUT
+        self.description = function_config.get('Description') or 'Function deployed for service {} by lmdo'.format(service)
+        self.tracing = function_config.get('Tracing')
+        self.vpc_config = function_config.get('VpcConfig')
+
+        # Convert all value to string
+        self.environment_variables = None
+        if function_config.get('EnvironmentVariables'):
+            self.environment_variables = dict((k, str(v)) for k, v in function_config.get('EnvironmentVariables').items())
+
+    def get_function_params(self, code):
+        """Parameters to create function with"""
+        params = {
+            'FunctionName': self.full_name,
+            'Code': code,
+            'Handler': self.handler,
+            'MemorySize': self.memory_size,
+            'Runtime': self.runtime,
+            'Timeout': self.timeout,
+            'Description': self.description
+        }
+
+        # If we have tracing flag active
+        params['TracingConfig'] = {'Mode': 'PassThrough'}
+        if self.tracing:
+            params['TracingConfig'] = {'Mode': 'Active'}
+
+        if self.vpc_config:
+            params['VpcConfig'] = self.vpc_config
+
+        if self.environment_variables:
+            params['Environment'] = {'Variables': self.environment_variables}
+
+        return params
+
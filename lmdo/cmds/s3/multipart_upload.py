@@ -0,0 +1,227 @@
+import hashlib
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from lmdo.oprint import Oprint
+
+
+class BufferedStream(object):
+    """
+    Writable file object handing its content over in order,
+    part by part, and computing its sha256 on the way. On its
+    own it only keeps the digest.
+
+    Seeking is allowed within the data not yet handed over so
+    ZipFile can rewrite the local header of the entry it's
+    writing. Once the write position is back at the end,
+    everything buffered is final and can be handed over.
+    """
+    PART_SIZE = 8 * 1024 * 1024
+
+    def __init__(self, part_size=None):
+        self._part_size = part_size or self.PART_SIZE
+        self._sha256 = hashlib.sha256()
+        self._buffer = BytesIO()
+        # Offset where buffer starts in the whole object
+        self._offset = 0
+        self._position = 0
+        self._size = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def size(self):
+        return self._size
+
+    def digest(self):
+        """sha256 of content handed over so far, all of it once closed"""
+        return self._sha256.digest()
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=0):
+        """Move write position in the part not yet handed over"""
+        if whence == 1:
+            offset += self._position
+        elif whence == 2:
+            offset += self._size
+
+        if offset < self._offset:
+            raise IOError('Cannot seek into data already handed over')
+
+        self._position = offset
+        if self._position == self._size:
+            self._flush_buffer()
+
+        return self._position
+
+    def write(self, data):
+        """Write data at current position"""
+        self._buffer.seek(self._position - self._offset)
+        self._buffer.write(data)
+        self._position += len(data)
+        self._size = max(self._size, self._position)
+
+    def flush(self):
+        if self._position == self._size:
+            self._flush_buffer()
+
+    def _is_part_ready(self, last=False):
+        """If buffered data should be handed over now"""
+        return last or self._size - self._offset >= self._part_size
+
+    def _send_part(self, data):
+        """Hand a final part over"""
+        pass
+
+    def _flush_buffer(self, last=False):
+        """Hand buffered data over as one part once it's big enough"""
+        if not self._is_part_ready(last):
+            return False
+
+        data = self._buffer.getvalue()
+        self._sha256.update(data)
+        self._send_part(data)
+
+        self._buffer = BytesIO()
+        self._offset = self._size
+
+        return True
+
+    def close(self):
+        """Hand what's left over"""
+        if self.closed:
+            return True
+
+        if self._size > self._offset:
+            self._flush_buffer(last=True)
+        self.closed = True
+
+        return True
+
+
+class MultipartUpload(BufferedStream):
+    """
+    Writable file object streaming its content into S3.
+    Data is buffered and shipped as multipart upload parts
+    in background threads while the caller keeps writing.
+
+    Nothing is sent before threshold bytes are buffered, small
+    objects can be taken back with getvalue() and abort()
+    """
+    MAX_WORKERS = 8
+
+    def __init__(self, client, bucket_name, key, part_size=None, max_workers=None, threshold=None, **kwargs):
+        super(MultipartUpload, self).__init__(part_size)
+        self._client = client
+        self._bucket_name = bucket_name
+        self._key = key
+        self._threshold = threshold or self._part_size
+        self._max_workers = max_workers or self.MAX_WORKERS
+        self._extra_args = kwargs
+        self._executor = None
+        self._upload_id = None
+        self._parts = []
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    @property
+    def started(self):
+        """If any data has been sent to S3"""
+        return self._upload_id is not None
+
+    def getvalue(self):
+        """Content written so far, only before upload has started"""
+        if self.started:
+            raise IOError('Content has been partially uploaded to S3')
+
+        return self._buffer.getvalue()
+
+    def _is_part_ready(self, last=False):
+        """Parts wait for threshold bytes before the upload starts"""
+        if not last and not self.started and self._size - self._offset < self._threshold:
+            return False
+
+        return super(MultipartUpload, self)._is_part_ready(last)
+
+    def _send_part(self, data):
+        """Upload part in background, upload is created on first part"""
+        if not self._upload_id:
+            Oprint.info('Start streaming {} to S3 bucket {}'.format(self._key, self._bucket_name), 's3')
+            response = self._client.create_multipart_upload(Bucket=self._bucket_name, Key=self._key, **self._extra_args)
+            self._upload_id = response['UploadId']
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+
+        part_number = len(self._parts) + 1
+        future = self._executor.submit(
+            self._client.upload_part,
+            Bucket=self._bucket_name,
+            Key=self._key,
+            UploadId=self._upload_id,
+            PartNumber=part_number,
+            Body=data
+        )
+        self._parts.append((part_number, future))
+
+    def close(self):
+        """Upload what's left and complete the upload"""
+        if self.closed:
+            return True
+
+        try:
+            # Nothing has been shipped yet, one request is enough
+            if not self._upload_id:
+                Oprint.info('Start uploading {} to S3 bucket {}'.format(self._key, self._bucket_name), 's3')
+                data = self._buffer.getvalue()
+                self._sha256.update(data)
+                self._client.put_object(Bucket=self._bucket_name, Key=self._key, Body=data, **self._extra_args)
+            else:
+                # Last flush may have shipped everything already
+                if self._size > self._offset:
+                    self._flush_buffer(last=True)
+                parts = [{'ETag': future.result()['ETag'], 'PartNumber': part_number} for part_number, future in self._parts]
+                self._client.complete_multipart_upload(
+                    Bucket=self._bucket_name,
+                    Key=self._key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={'Parts': parts}
+                )
+                self._executor.shutdown()
+        except Exception:
+            self.abort()
+            raise
+
+        self.closed = True
+        self._buffer = BytesIO()
+
+        return True
+
+    def abort(self):
+        """Cancel the upload, uploaded parts are discarded"""
+        if self.closed:
+            return True
+
+        self.closed = True
+        self._buffer = BytesIO()
+
+        if self._upload_id:
+            self._executor.shutdown()
+            try:
+                self._client.abort_multipart_upload(Bucket=self._bucket_name, Key=self._key, UploadId=self._upload_id)
+            except Exception as e:
+                Oprint.warn(e, 's3')
+
+        return True
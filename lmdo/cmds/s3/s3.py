@@ -1,22 +1,32 @@
 from __future__ import print_function
 import os
 import fnmatch
+import threading
 import mimetypes
 
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
 from lmdo.cmds.aws_base import AWSBase
 from lmdo.oprint import Oprint
 from lmdo.utils import sys_pause
 from lmdo.waiters.s3_waiters import S3WaiterBucketCreate, S3WaiterBucketDelete, S3WaiterObjectCreate
-from lmdo.config import S3_UPLOAD_EXCLUDE, PROJECT_CONFIG_FILE
+from lmdo.config import S3_UPLOAD_EXCLUDE, PROJECT_CONFIG_FILE, S3_MULTIPART_THRESHOLD, \
+        S3_MULTIPART_CHUNKSIZE, S3_MAX_CONCURRENCY
 from lmdo.file_upload_progress import FileUploadProgress
+from lmdo.cmds.s3.multipart_upload import MultipartUpload
 
 
 class S3(AWSBase):
     """S3 handler"""
     def __init__(self):
         super(S3, self).__init__()
-        self._client = self.get_client('s3')
+        self._client = self.get_cached_client('s3')
         self._resource = self.get_resource('s3')
+        # Buckets checked already, guarded as deploy workers
+        # share this instance and its resource
+        self._confirmed_buckets = set()
+        self._bucket_lock = threading.Lock()
 
     @property
     def client(self):
@@ -57,12 +67,21 @@ class S3(AWSBase):
 
         return True
 
+    def confirm_bucket(self, bucket_name):
+        """Check if bucket exist, create one if user agrees"""
+        with self._bucket_lock:
+            if bucket_name not in self._confirmed_buckets:
+                if not self.if_bucket_exist(bucket_name):
+                    sys_pause('Bucket {} doesn\'t exist! Do you want to create it? [yes/no]'.format(bucket_name), 'yes')
+                    self.create_bucket(bucket_name)
+
+                self._confirmed_buckets.add(bucket_name)
+
+        return True
+
     def upload_file(self, bucket_name, file_path, key, **kwargs):
         """Upload file to S3, provide network progress bar"""
-        # Check if bucket exist, create one if user agrees
-        if not self.if_bucket_exist(bucket_name):
-            sys_pause('Bucket {} doesn\'t exist! Do you want to create it? [yes/no]'.format(bucket_name), 'yes')
-            self.create_bucket(bucket_name)
+        self.confirm_bucket(bucket_name)
 
         file_size = os.path.getsize(file_path)/1000000
         if round(file_size) <= 0:
@@ -72,6 +91,13 @@ class S3(AWSBase):
 
         Oprint.info('Start uploading {} to S3 bucket {}. ({})'.format(key, bucket_name, file_size), 's3')
         #waiter = S3WaiterObjectCreate(self._client)
+        # Bigger parts uploaded concurrently saturate a single upload
+        kwargs.setdefault('Config', TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=S3_MAX_CONCURRENCY,
+            use_threads=True
+        ))
         self._client.upload_file(file_path, bucket_name, key, Callback=FileUploadProgress(file_path), **kwargs)
 
         #waiter.wait(bucket_name, key)
@@ -79,6 +105,34 @@ class S3(AWSBase):
 
         return True
 
+    def get_object_metadata(self, bucket_name, key):
+        """Fetch user metadata of object, empty if it doesn't exist"""
+        try:
+            return self._client.head_object(Bucket=bucket_name, Key=key).get('Metadata', {})
+        except ClientError:
+            return {}
+
+    def copy_object(self, bucket_name, from_key, to_key):
+        """Copy object within bucket, metadata is copied along"""
+        self._client.copy_object(Bucket=bucket_name, Key=to_key, CopySource={'Bucket': bucket_name, 'Key': from_key})
+
+        return True
+
+    def delete_object(self, bucket_name, key):
+        """Delete one object, deleting a missing one is fine"""
+        self._client.delete_object(Bucket=bucket_name, Key=key)
+
+        return True
+
+    def open_upload(self, bucket_name, key, **kwargs):
+        """
+        Open a file object streaming what's written
+        into S3 object key. Upload completes on close
+        """
+        self.confirm_bucket(bucket_name)
+
+        return MultipartUpload(self._client, bucket_name, key, **kwargs)
+
     def get_bucket_url(self, bucket_name):
         """fetch s3 bucket url"""
         return 'https://s3.amazonaws.com/{}'.format(bucket_name)
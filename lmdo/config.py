@@ -22,6 +22,12 @@ CLOUDFORMATION_STACK_UNLOCK_POLICY = 'stack_unlock_policy.json'
 LAMBDA_MEMORY_SIZE = 128
 LAMBDA_RUNTIME= 'python2.7'
 LAMBDA_TIMEOUT = 180
+# Maximum functions deployed concurrently
+LAMBDA_MAX_WORKERS = 32
+# Packages up to this size are sent to Lambda without S3. Zip content
+# is base64 encoded in a request limited to 69,905,067 bytes (50MB
+# once decoded), leave room for the encoding overhead of the envelope
+LAMBDA_DIRECT_UPLOAD_SIZE = 45 * 1024 * 1024
 
 # Files and directories excluding from packaging
 LAMBDA_EXCLUDE= {
@@ -56,6 +62,11 @@ SWAGGER_DIR = 'swagger'
 SWAGGER_FILE = 'apigateway.json'
 
 # S3
+# Multipart transfer for single file upload
+S3_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+S3_MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+S3_MAX_CONCURRENCY = 16
+
 S3_UPLOAD_EXCLUDE = {
     'dir': [
         '*.git*',
@@ -7,6 +7,7 @@ import re
 import site
 import time
 import shutil
+import hashlib
 from functools import wraps
 
 from botocore.exceptions import ClientError
@@ -17,6 +18,10 @@ from lmdo.oprint import Oprint
 """Common utility functions"""
 
 
+# Earliest timestamp zip format supports
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+
 def mkdir(path, mode=0777):
     """Wrapper for mkdir"""
     try:
@@ -52,10 +57,75 @@ def zipper(from_path, target_file_name, exclude=None, delete_exist=True, replace
             pass
     
     mode = 'a' if not delete_exist else 'w'
-    zip_file = zipfile.ZipFile(target_file_name, mode, zipfile.ZIP_DEFLATED)
-   
+    zip_file = open_zip(target_file_name, mode)
+    zip_dir(zip_file, from_path, exclude, replace_base_path)
+    zip_file.close()
+
+    Oprint.info('Package {} has been created'.format(target_file_name), 'lmdo')
+
+    return True
+
+def open_zip(target, mode='w'):
+    """Open deflated ZipFile for writing"""
+    return zipfile.ZipFile(target, mode, zipfile.ZIP_DEFLATED)
+
+def zip_dir(zip_file, from_path, exclude=None, replace_base_path=None):
+    """
+    Write directory content into an opened ZipFile
+
+        exclude = {
+            'dir': [],
+            'file': []
+        }
+    """
     Oprint.info('Start packaging directory {}'.format(from_path), 'lmdo')
-   
+    zip_files(zip_file, list_dir_files(from_path, exclude, replace_base_path))
+    Oprint.info('Finished packaging directory {}'.format(from_path), 'lmdo')
+
+    return True
+
+def set_zip_date_time(file_info):
+    """
+    Set mtime of a file listed by list_dir_files to ZIP_DATE_TIME
+    so zip_files can stream it as is, return the updated entry
+    """
+    abs_path, arcname, _, size, mode = file_info
+    timestamp = time.mktime(ZIP_DATE_TIME + (0, 0, -1))
+    os.utime(abs_path, (timestamp, timestamp))
+
+    return (abs_path, arcname, timestamp, size, mode)
+
+def zip_files(zip_file, file_list):
+    """
+    Write files listed by list_dir_files into an opened ZipFile.
+    Timestamps are fixed so same content gives identical archive.
+    Files at ZIP_DATE_TIME are streamed, others are read whole
+    """
+    for abs_path, arcname, mtime, _, mode in file_list:
+        arcname = os.path.normpath(arcname).lstrip(os.sep).replace(os.sep, '/')
+        if time.localtime(mtime)[0:6] == ZIP_DATE_TIME:
+            zip_file.write(abs_path, arcname)
+            continue
+
+        zinfo = zipfile.ZipInfo(arcname, ZIP_DATE_TIME)
+        zinfo.external_attr = (mode & 0xFFFF) << 16
+        zinfo.compress_type = zip_file.compression
+        with open(abs_path, 'rb') as f:
+            zip_file.writestr(zinfo, f.read())
+
+    return True
+
+def list_dir_files(from_path, exclude=None, replace_base_path=None):
+    """
+    Walk directory once and list files to package as
+    (abs_path, arcname, mtime, size, mode)
+
+        exclude = {
+            'dir': [],
+            'file': []
+        }
+    """
+    output = []
     for root, dirs, files in os.walk(from_path):
         bp = root
         if replace_base_path:
@@ -63,12 +133,9 @@ def zipper(from_path, target_file_name, exclude=None, delete_exist=True, replace
                 if fnmatch.fnmatch(root, '*'+p_th.get('from_path')+'*'):
                     bp = root.replace(p_th.get('from_path'), p_th.get('to_path'))
 
-        if not exclude:
-            for f in files:
-                zip_file.write(os.path.join(root, f), os.path.join(bp, f))
-        else:
-            for f in files:
-                excl = False
+        for f in files:
+            excl = False
+            if exclude:
                 #check if file/folder should be excluded
                 if exclude.get('dir'):
                     for ex_dir in exclude['dir']:
@@ -88,14 +155,26 @@ def zipper(from_path, target_file_name, exclude=None, delete_exist=True, replace
                             excl = True
                             break
 
-                if not excl:                    
-                    zip_file.write(os.path.join(root, f), os.path.join(bp, f))
+            if not excl:
+                abs_path = os.path.join(root, f)
+                stat = os.stat(abs_path)
+                output.append((abs_path, os.path.join(bp, f), stat.st_mtime, stat.st_size, stat.st_mode))
 
-    zip_file.close()
+    return output
 
-    Oprint.info('Finished packaging directory {}. Package {} has been created'.format(from_path, target_file_name), 'lmdo')
+def hash_file_list(file_list):
+    """
+    Digest of listed files name, mode and content,
+    equal digests yield identical packages
+    """
+    digest = hashlib.sha256()
+    for abs_path, arcname, _, size, mode in file_list:
+        digest.update('{}:{}:{:o}\n'.format(arcname, size, mode).encode('utf-8'))
+        with open(abs_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
 
-    return True
+    return digest.hexdigest()
 
 def find_files_by_postfix(path, postfix):
     """Find files with given postfix in path"""
@@ -223,13 +302,14 @@ def class_function_retry(aws_retry_condition=False, tries=3, delay=1, backoff=2)
                 try:
                     return func(self, *args, **kwargs)
                 except ClientError as ce:
-                    Oprint.warn(str(ce.response['Error']['Message']), 'aws')
                     if aws_retry_condition:
                         code = ce.response['Error']['Code']
-                        # If it's not in the retry condition set tries to 1 so to stop the while loop
+                        # If it's not in the retry condition let the caller handle it
                         if (type(aws_retry_condition) is str and aws_retry_condition != code) or \
                             (type(aws_retry_condition) is list and code not in aws_retry_condition):
-                                c_tries = 1
+                                raise
+
+                    Oprint.warn(str(ce.response['Error']['Message']), 'aws')
                 except Exception as e:
                     Oprint.warn(e, 'lmdo')
 
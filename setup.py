@@ -64,6 +64,8 @@ setup(
         'jinja2==2.8',
         'gitpython',
         'lambda-packages==0.13.0',
+        'requests',
+        'futures; python_version < "3.0"',
     ],
     extras_require={
         'test': ['coverage', 'pytest', 'pytest-cov'],
@@ -0,0 +1,164 @@
+import io
+import zipfile
+import hashlib
+from unittest import TestCase
+
+from lmdo.cmds.s3.multipart_upload import BufferedStream, MultipartUpload
+
+
+class StubClient(object):
+    """Record S3 calls made by MultipartUpload"""
+    def __init__(self, fail_on=None):
+        self.calls = []
+        self.parts = {}
+        self.objects = {}
+        self._fail_on = fail_on
+
+    def _call(self, name, **kwargs):
+        self.calls.append(name)
+        if name == self._fail_on:
+            raise Exception('{} failed'.format(name))
+
+    def create_multipart_upload(self, **kwargs):
+        self._call('create_multipart_upload', **kwargs)
+        return {'UploadId': 'upload-id'}
+
+    def upload_part(self, PartNumber, Body, **kwargs):
+        self._call('upload_part', **kwargs)
+        self.parts[PartNumber] = Body
+        return {'ETag': 'etag-{}'.format(PartNumber)}
+
+    def complete_multipart_upload(self, Key, MultipartUpload, **kwargs):
+        self._call('complete_multipart_upload', **kwargs)
+        self.objects[Key] = b''.join(self.parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, **kwargs):
+        self._call('abort_multipart_upload', **kwargs)
+
+    def put_object(self, Key, Body, **kwargs):
+        self._call('put_object', **kwargs)
+        self.objects[Key] = Body
+
+
+def zip_content(fileobj):
+    """Zip a few entries into fileobj"""
+    zip_file = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED)
+    for i in range(5):
+        zinfo = zipfile.ZipInfo('file{}.txt'.format(i), (1980, 1, 1, 0, 0, 0))
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zip_file.writestr(zinfo, hashlib.sha256(str(i).encode('utf-8')).hexdigest() * 1000)
+    zip_file.close()
+
+    return fileobj
+
+
+class TestMultipartUpload(TestCase):
+    """Test streaming upload"""
+    def test_parts_split_at_part_size(self):
+        client = StubClient()
+        upload = MultipartUpload(client, 'bucket', 'key', part_size=10)
+        for _ in range(7):
+            upload.write(b'abcd')
+            upload.flush()
+        upload.close()
+
+        self.assertEqual(client.calls[0], 'create_multipart_upload')
+        self.assertEqual(client.calls[-1], 'complete_multipart_upload')
+        self.assertEqual(client.objects['key'], b'abcd' * 7)
+        # Every part but the last is at least part_size
+        sizes = [len(client.parts[number]) for number in sorted(client.parts)]
+        self.assertEqual(sizes, [12, 12, 4])
+        self.assertEqual(upload.digest(), hashlib.sha256(b'abcd' * 7).digest())
+
+    def test_no_empty_last_part(self):
+        client = StubClient()
+        upload = MultipartUpload(client, 'bucket', 'key', part_size=8)
+        for _ in range(4):
+            upload.write(b'abcd')
+            upload.flush()
+        upload.close()
+
+        sizes = [len(client.parts[number]) for number in sorted(client.parts)]
+        self.assertEqual(sizes, [8, 8])
+        self.assertEqual(client.objects['key'], b'abcd' * 4)
+
+    def test_seek_within_buffer(self):
+        client = StubClient()
+        upload = MultipartUpload(client, 'bucket', 'key', part_size=10)
+        upload.write(b'0000')
+        upload.write(b'tail')
+        upload.seek(0)
+        upload.write(b'head')
+        upload.seek(0, 2)
+        upload.close()
+
+        self.assertEqual(client.objects['key'], b'headtail')
+
+    def test_seek_into_uploaded_data(self):
+        upload = MultipartUpload(StubClient(), 'bucket', 'key', part_size=4)
+        upload.write(b'abcdef')
+        upload.flush()
+
+        self.assertRaises(IOError, upload.seek, 2)
+
+    def test_small_object_uses_put_object(self):
+        client = StubClient()
+        with MultipartUpload(client, 'bucket', 'key', part_size=100) as upload:
+            upload.write(b'small')
+
+        self.assertEqual(client.calls, ['put_object'])
+        self.assertEqual(client.objects['key'], b'small')
+        self.assertEqual(upload.digest(), hashlib.sha256(b'small').digest())
+
+    def test_threshold_holds_back_upload(self):
+        client = StubClient()
+        upload = MultipartUpload(client, 'bucket', 'key', part_size=4, threshold=100)
+        upload.write(b'abcdefgh')
+        upload.flush()
+
+        self.assertFalse(upload.started)
+        self.assertEqual(upload.getvalue(), b'abcdefgh')
+        upload.abort()
+        self.assertEqual(client.calls, [])
+
+    def test_abort_on_error(self):
+        client = StubClient()
+        try:
+            with MultipartUpload(client, 'bucket', 'key', part_size=4) as upload:
+                upload.write(b'abcdefgh')
+                upload.flush()
+                raise ValueError('zipping failed')
+        except ValueError:
+            pass
+
+        self.assertIn('abort_multipart_upload', client.calls)
+        self.assertNotIn('complete_multipart_upload', client.calls)
+        self.assertTrue(upload.closed)
+
+    def test_abort_when_complete_fails(self):
+        client = StubClient(fail_on='complete_multipart_upload')
+        upload = MultipartUpload(client, 'bucket', 'key', part_size=4)
+        upload.write(b'abcdefgh')
+        upload.flush()
+
+        self.assertRaises(Exception, upload.close)
+        self.assertEqual(client.calls[-1], 'abort_multipart_upload')
+
+    def test_streamed_zip(self):
+        client = StubClient()
+        with MultipartUpload(client, 'bucket', 'key', part_size=1024) as upload:
+            zip_content(upload)
+
+        expected = zip_content(io.BytesIO()).getvalue()
+        self.assertTrue(len(client.parts) > 1)
+        self.assertEqual(client.objects['key'], expected)
+        self.assertIsNone(zipfile.ZipFile(io.BytesIO(client.objects['key'])).testzip())
+
+
+class TestBufferedStream(TestCase):
+    """Test hash only stream"""
+    def test_digest_of_zip(self):
+        stream = zip_content(BufferedStream(part_size=1))
+        stream.close()
+
+        self.assertEqual(stream.digest(), hashlib.sha256(zip_content(io.BytesIO()).getvalue()).digest())
@@ -0,0 +1,65 @@
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+from unittest import TestCase
+
+from lmdo.utils import open_zip, zip_files, list_dir_files, hash_file_list, set_zip_date_time
+
+
+class TestPackageFiles(TestCase):
+    """Test package listing, digest and zip"""
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self._dir, 'pkg'))
+        self.write_file('handler.py', 'def handler(event, context):\n    pass\n')
+        self.write_file(os.path.join('pkg', 'module.py'), 'VALUE = 1\n' * 1000)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def write_file(self, name, content):
+        with open(os.path.join(self._dir, name), 'w') as f:
+            f.write(content)
+
+    def list_files(self):
+        return list_dir_files(self._dir, None, [{'from_path': self._dir, 'to_path': '.'}])
+
+    def zip_package(self, file_list=None):
+        target = io.BytesIO()
+        zip_file = open_zip(target)
+        zip_files(zip_file, file_list or self.list_files())
+        zip_file.close()
+
+        return target.getvalue()
+
+    def test_hash_file_list(self):
+        digest = hash_file_list(self.list_files())
+        self.assertEqual(digest, hash_file_list(self.list_files()))
+
+        self.write_file('handler.py', 'def handler(event, context):\n    return 1\n')
+        self.assertNotEqual(digest, hash_file_list(self.list_files()))
+
+    def test_hash_file_list_names(self):
+        digest = hash_file_list(self.list_files())
+        os.rename(os.path.join(self._dir, 'handler.py'), os.path.join(self._dir, 'main.py'))
+
+        self.assertNotEqual(digest, hash_file_list(self.list_files()))
+
+    def test_zip_is_reproducible(self):
+        content = self.zip_package()
+        os.utime(os.path.join(self._dir, 'handler.py'), (0, 1000000000))
+
+        self.assertEqual(content, self.zip_package())
+
+    def test_zip_fixed_date_time(self):
+        content = self.zip_package()
+        file_list = [set_zip_date_time(file_info) for file_info in self.list_files()]
+
+        self.assertEqual(content, self.zip_package(file_list))
+        self.assertEqual(content, self.zip_package())
+        zip_file = zipfile.ZipFile(io.BytesIO(content))
+        self.assertIsNone(zip_file.testzip())
+        self.assertEqual(sorted(zip_file.namelist()), ['handler.py', 'pkg/module.py'])
+        self.assertEqual(set(info.date_time for info in zip_file.infolist()), set([(1980, 1, 1, 0, 0, 0)]))